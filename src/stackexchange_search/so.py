@@ -2,26 +2,41 @@ import typing as ty
 import time
 import html
 import argparse
-import re
-import itertools
 import subprocess
 import contextlib
+import threading
 import functools
-import gzip
+import pickle
+import random
 from pathlib import Path
 import os
+import sys
 import hashlib
+import math
 import json
 import dataclasses
 import io
+import concurrent.futures
 import logging
 
-import requests
-from PIL import Image
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+if ty.TYPE_CHECKING:
+    import requests
 
 
 @dataclasses.dataclass
 class Answer:
+    __slots__ = ('title', 'link', 'tags', 'is_answered', 'score')
+
     title: str
     link: str
     tags: ty.List[str]
@@ -31,6 +46,8 @@ class Answer:
 
 @dataclasses.dataclass
 class Site:
+    __slots__ = ('id_', 'name', 'audience', 'icon_url', 'is_meta')
+
     id_: str
     name: str
     audience: str
@@ -40,11 +57,24 @@ class Site:
 
 @dataclasses.dataclass
 class QuotaInfo:
+    __slots__ = ('quota_remaining', )
+
     quota_remaining: int
 
 
 @dataclasses.dataclass
 class EnvParams:
+    __slots__ = (
+        'cache_max_age',
+        'ignore_meta_sites',
+        'result_count',
+        'site_id',
+        'site_name',
+        'api_key',
+        'client_id',
+        'proxy',
+    )
+
     cache_max_age: int
     ignore_meta_sites: bool
     result_count: int
@@ -56,48 +86,111 @@ class EnvParams:
 
 
 def get_cachedir() -> Path:
-    path = Path(os.environ['alfred_workflow_cache'])
-    path.mkdir(exist_ok=True)
-    return path
+    path = os.environ['alfred_workflow_cache']
+    if not os.path.isdir(path):
+        # Another invocation may be creating it at the same time
+        os.makedirs(path, exist_ok=True)
+    return Path(path)
 
 
 def validate_env() -> EnvParams:
     logger = logging.getLogger('so.validate_env')
-    cache_max_age = int(os.environ['cache_max_age'])
-    logger.debug('Got cache_max_age=%d', cache_max_age)
-    ignore_meta_sites = bool(int(os.environ['ignore_meta_sites']))
-    logger.debug('Got ignore_meta_sites=%d', ignore_meta_sites)
-    result_count = int(os.environ['result_count'])
-    logger.debug('Got result_count=%d', result_count)
-    site_id = os.getenv('site_id')
-    logger.debug('Got site_id=%r', site_id)
-    site_name = os.getenv('site_name')
-    logger.debug('Got site_name=%r', site_name)
-    api_key = os.environ['api_key'] or None
-    logger.debug('Got api_key=%r', api_key)
-    client_id = os.environ['client_id'] or None
-    logger.debug('Got client_id=%r', client_id)
-    proxy = os.environ['proxy'] or None
-    logger.debug('Got proxy=%r', proxy)
-    return EnvParams(
-        cache_max_age,
-        ignore_meta_sites,
-        result_count,
-        site_id,
-        site_name,
-        api_key,
-        client_id,
-        proxy,
+    env = EnvParams(
+        int(os.environ['cache_max_age']),
+        bool(int(os.environ['ignore_meta_sites'])),
+        int(os.environ['result_count']),
+        os.getenv('site_id'),
+        os.getenv('site_name'),
+        os.environ['api_key'] or None,
+        os.environ['client_id'] or None,
+        os.environ['proxy'] or None,
     )
+    if logger.isEnabledFor(logging.DEBUG):
+        for field in dataclasses.fields(env):
+            logger.debug('Got %s=%r', field.name, getattr(env, field.name))
+    return env
+
 
+def fast_unescape(s: str) -> str:
+    """``html.unescape``, skipped if there's no character reference at all."""
+    return html.unescape(s) if '&' in s else s
 
-def build_requests_kwargs(env: EnvParams) -> ty.Dict[str, ty.Any]:
-    ua = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:109.0) '
-          'Gecko/20100101 Firefox/109.0')
-    kwargs = {'headers': {'user-agent': ua}}
+
+# Icon shown for sites whose icon has not been cached
+FALLBACK_ICON = 'icon.png'
+
+USER_AGENT = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:109.0) '
+              'Gecko/20100101 Firefox/109.0')
+SEARCH_API_URL = 'https://api.stackexchange.com/2.2/search/advanced'
+SITES_API_URL = 'https://api.stackexchange.com/2.2/sites'
+# Search API parameters that do not depend on the query
+SEARCH_API_BASE_PARAMS = {
+    'page': 1,
+    'order': 'desc',
+    'sort': 'relevance',
+}
+
+# Timeout in seconds of every HTTP request
+REQUEST_TIMEOUT = 10
+# Number of icons downloaded concurrently; the connection pool of the shared
+# session is sized accordingly so that no worker waits for a connection
+ICON_DOWNLOAD_WORKERS = 16
+# Number of hosts whose connection pools the shared session keeps alive; the
+# API host plus the few CDN hosts serving the site icons fit comfortably
+SESSION_POOL_HOSTS = 16
+
+_session: ty.Optional['requests.Session'] = None
+
+
+def get_session() -> 'requests.Session':
+    """
+    Get the keep-alive session shared by all HTTP requests, so that
+    connections to the same host are pooled rather than re-established.
+    """
+    global _session
+    if _session is not None:
+        return _session
+    import requests
+
+    _session = requests.Session()
+    _session.headers.update({'user-agent': USER_AGENT})
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=SESSION_POOL_HOSTS,
+        pool_maxsize=ICON_DOWNLOAD_WORKERS)
+    _session.mount('http://', adapter)
+    _session.mount('https://', adapter)
+    return _session
+
+
+def get_proxies(env: EnvParams) -> ty.Optional[ty.Dict[str, str]]:
+    """
+    Get the ``proxies`` argument of every request. It must be passed per
+    request rather than set on the session, where requests would let the
+    proxies of the environment (including macOS system settings) override
+    it.
+
+    :param env: preconfigured environment parameters
+    """
     if env.proxy:
-        kwargs['proxies'] = {'http': env.proxy, 'https': env.proxy}
-    return kwargs
+        return {'http': env.proxy, 'https': env.proxy}
+    return None
+
+
+_api_json_parser: ty.Optional['simdjson.Parser'] = None
+
+
+def parse_api_response(content: bytes) -> ty.Any:
+    """
+    Parse the JSON body of an API response. If pysimdjson is available, the
+    document is parsed lazily by a reused parser, and all objects obtained
+    from it must be released before the next call.
+    """
+    global _api_json_parser
+    if simdjson is None:
+        return json_loads(content)
+    if _api_json_parser is None:
+        _api_json_parser = simdjson.Parser()
+    return _api_json_parser.parse(content)
 
 
 def request_parse_search_api(
@@ -115,12 +208,10 @@ def request_parse_search_api(
     :param env: preconfigured environment parameters
     """
     logger = logging.getLogger('so.request_search_api')
-    url = 'https://api.stackexchange.com/2.2/search/advanced'
+    url = SEARCH_API_URL
     params = {
-        'page': 1,
+        **SEARCH_API_BASE_PARAMS,
         'pagesize': env.result_count,
-        'order': 'desc',
-        'sort': 'relevance',
         'site': site_id,
     }
     if env.api_key:
@@ -133,7 +224,12 @@ def request_parse_search_api(
         params['tagged'] = ';'.join(tags)
 
     logger.debug('Requesting %r for search', url)
-    resp = requests.get(url, params, **build_requests_kwargs(env)).json()
+    content = get_session().get(
+        url,
+        params=params,
+        proxies=get_proxies(env),
+        timeout=REQUEST_TIMEOUT).content
+    resp = parse_api_response(content)
     logger.debug('Done requesting %r for search', url)
 
     answers = []
@@ -141,17 +237,21 @@ def request_parse_search_api(
         for item in resp['items']:
             answers.append(
                 Answer(
-                    html.unescape(item['title']),
+                    fast_unescape(item['title']),
                     item['link'],
-                    item['tags'],
+                    list(item['tags']),
                     item['is_answered'],
                     int(item['score']),
                 ))
     except KeyError:
-        logger.error('Unexpected response json: %r', resp)
+        # resp may be a lazy simdjson proxy whose repr shows nothing
+        logger.error('Unexpected response json: %s',
+                     content.decode('utf-8', 'replace'))
         raise
     logger.debug('Parsed %d answers out of the request', len(answers))
-    answers.sort(key=lambda a: int(a.is_answered), reverse=True)
+    # Answered questions first, keeping the relevance order within each group
+    answers = ([a for a in answers if a.is_answered] +
+               [a for a in answers if not a.is_answered])
     qi = QuotaInfo(resp['quota_remaining'])
     logger.debug('Parsed the QuotaInfo out of the request')
     return answers, qi
@@ -164,7 +264,9 @@ def request_parse_sites_api(env: EnvParams) -> ty.List[Site]:
     :param env: preconfigured environment parameters
     """
     logger = logging.getLogger('so.request_sites_api')
-    url = 'https://api.stackexchange.com/2.2/sites'
+    url = SITES_API_URL
+    session = get_session()
+    proxies = get_proxies(env)
     sites = []
     page = 1
     has_more = True
@@ -179,7 +281,10 @@ def request_parse_sites_api(env: EnvParams) -> ty.List[Site]:
         if env.client_id:
             params['client_id'] = env.client_id
         logger.debug('Requesting %r for sites', url)
-        resp = requests.get(url, params, **build_requests_kwargs(env)).json()
+        content = session.get(
+            url, params=params, proxies=proxies,
+            timeout=REQUEST_TIMEOUT).content
+        resp = parse_api_response(content)
         logger.debug('Done requesting %r for sites', url)
 
         try:
@@ -191,34 +296,90 @@ def request_parse_sites_api(env: EnvParams) -> ty.List[Site]:
                 sites.append(
                     Site(
                         item['api_site_parameter'],
-                        html.unescape(item['name']),
+                        fast_unescape(item['name']),
                         item['audience'],
                         item['icon_url'],
                         item['site_type'] == 'meta_site',
                     ))
         except KeyError:
-            logger.error('Unexpected response json: %r', resp)
+            # resp may be a lazy simdjson proxy whose repr shows nothing
+            logger.error('Unexpected response json: %s',
+                         content.decode('utf-8', 'replace'))
             raise
         logger.debug('Parsed %d sites in total out of the request', len(sites))
         has_more = resp['has_more']
+        # Release the parsed document before the parser is reused
+        resp = item = None
         page += 1
     return sites
 
 
-def request_fzf(query: str, candidates: ty.List[str]) -> ty.List[str]:
-    logger = logging.getLogger('so.request_fzf')
+def write_lines(stream: ty.BinaryIO, lines: ty.Iterable[str]) -> None:
+    """Write ``lines`` UTF-8 encoded to ``stream`` one by one and close it."""
+    # The reader may exit before consuming all lines. The stream is closed
+    # in any case, otherwise the reader would wait for more input forever.
     try:
-        resp = subprocess.run(['fzf', '--filter', query],
-                              input=''.join(map('{}\n'.format, candidates)),
-                              text=True,
-                              capture_output=True,
-                              check=True)
-    except subprocess.CalledProcessError as err:
-        if err.returncode == 1:
-            return []
+        with contextlib.suppress(BrokenPipeError):
+            for line in lines:
+                stream.write(line.encode('utf-8'))
+                stream.write(b'\n')
+    finally:
+        with contextlib.suppress(BrokenPipeError):
+            stream.close()
+
+
+def request_fzf(query: str, candidates: ty.List[str]) -> ty.List[int]:
+    """
+    Filter ``candidates`` with fzf. Returns the indices of the matching
+    candidates, best match first.
+    """
+    logger = logging.getLogger('so.request_fzf')
+    # Each line is prefixed with the candidate's index, which fzf is told to
+    # leave out of matching, so that the result maps back to the candidates
+    # by position rather than by (possibly duplicate) text. The index is
+    # zero-padded so that it adds the same length to every line, leaving
+    # fzf's length tiebreak between equally scored candidates unchanged.
+    args = ['fzf', '--filter', query, '--delimiter', '\t', '--nth', '2..']
+    width = len(str(len(candidates)))
+    lines = ('{:0{}d}\t{}'.format(i, width, c)
+             for i, c in enumerate(candidates))
+    # Stream the candidates from a separate thread so that fzf starts
+    # reading while we are still writing, without building the whole input
+    # up front, and without blocking on a full stdout pipe.
+    # The pipes are binary so that the encoding is always UTF-8, regardless
+    # of the locale Alfred runs us in.
+    with subprocess.Popen(args, stdin=subprocess.PIPE,
+                          stdout=subprocess.PIPE) as proc:
+        writer = threading.Thread(
+            target=write_lines, args=(proc.stdin, lines))
+        writer.start()
+        stdout = proc.stdout.read().decode('utf-8')
+        writer.join()
+        returncode = proc.wait()
+    if returncode == 1:
+        return []
+    if returncode != 0:
         logger.error('Error calling: fzf --filter %r', query)
-        raise
-    return re.findall(r'(.*)\n', resp.stdout)
+        raise subprocess.CalledProcessError(returncode, args, stdout)
+    # Every complete line is terminated by '\n', so the last piece is either
+    # empty or an incomplete line
+    return [
+        int(line.partition('\t')[0]) for line in stdout.split('\n')[:-1]
+    ]
+
+
+@functools.lru_cache(maxsize=32)
+def answers_key(site_id: str, query: str, tags: ty.Tuple[str, ...]) -> str:
+    """Get the 12 hex digits identifying a cached search."""
+    # Same digest as hashing '_'.join([site_id, query, *tags]), without
+    # building the joined string
+    h = hashlib.blake2b(site_id.encode('utf-8'), digest_size=6)
+    h.update(b'_')
+    h.update(query.encode('utf-8'))
+    for t in tags:
+        h.update(b'_')
+        h.update(t.encode('utf-8'))
+    return h.hexdigest()
 
 
 class CacheDirectory:
@@ -226,17 +387,29 @@ class CacheDirectory:
     Manage the location of caches.
 
     The ``get_XXX_cache`` methods return Path of the target cache file to
-    read or write. The returned Path may or may not exist.
+    read or write. The returned Path may or may not exist. The
+    subdirectories are created on demand by the ``ensure_XXX_dir`` methods,
+    which should be called before writing into them.
     """
     def __init__(self) -> None:
         self.cachedir = get_cachedir()
-        self.key_len = 12
         self.answers_dir = self.cachedir / 'answers'
-        with contextlib.suppress(FileExistsError):
-            os.mkdir(self.answers_dir)
         self.icons_dir = self.cachedir / 'icons'
-        with contextlib.suppress(FileExistsError):
-            os.mkdir(self.icons_dir)
+        self._ensured: ty.Set[Path] = set()
+
+    def _ensure_dir(self, path: Path) -> None:
+        if path not in self._ensured:
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+            self._ensured.add(path)
+
+    def ensure_answers_dir(self) -> None:
+        """Create the answers directory if not exists."""
+        self._ensure_dir(self.answers_dir)
+
+    def ensure_icons_dir(self) -> None:
+        """Create the icons directory if not exists."""
+        self._ensure_dir(self.icons_dir)
 
     def get_answers_cache(
         self,
@@ -244,11 +417,9 @@ class CacheDirectory:
         query: str,
         tags: ty.List[str],
     ) -> Path:
-        """Get Path to a collection of gzipped cached answers."""
-        sbuf = [site_id, query]
-        sbuf.extend(tags)
-        h = hashlib.sha1('_'.join(sbuf).encode('utf-8')).hexdigest()
-        return self.answers_dir / (h[:self.key_len] + '.json.gz')
+        """Get Path to a collection of pickled cached answers."""
+        return self.answers_dir / (answers_key(site_id, query, tuple(tags)) +
+                                   '.pkl')
 
     def get_site_icon_cache(
         self,
@@ -257,62 +428,243 @@ class CacheDirectory:
         """Get Path to a cached site icon."""
         return self.icons_dir / (site_id + '.png')
 
+    def existing_icon_set(self) -> ty.FrozenSet[str]:
+        """Get the IDs of the sites whose icons have been cached."""
+        # DirEntry.is_file() is answered from the directory listing itself on
+        # most platforms, without a stat per entry
+        try:
+            with os.scandir(self.icons_dir) as it:
+                return frozenset(e.name[:-4] for e in it
+                                 if e.name.endswith('.png') and e.is_file())
+        except FileNotFoundError:
+            return frozenset()
+
     def get_sites_cache(self,) -> Path:
         """Get Path to sites info."""
         return self.cachedir / 'all_sites.json'
 
+    def get_hits_cache(self) -> Path:
+        """Get Path to the access counts of cached answers."""
+        return self.cachedir / 'hits.json'
+
+
+def json_loads(raw: bytes) -> ty.Any:
+    """Parse JSON with orjson if available, else with the json module."""
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def json_dumps(
+    obj: ty.Any,
+    default: ty.Optional[ty.Callable[[ty.Any], ty.Any]] = None,
+) -> bytes:
+    """
+    Serialize ``obj`` to UTF-8 encoded JSON with orjson if available, else
+    with the json module. Dataclasses are always handed to ``default``.
+    """
+    if orjson:
+        return orjson.dumps(
+            obj, default=default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(obj, default=default, ensure_ascii=False).encode('utf-8')
+
+
+# Version 1 is a bare list of sites; version 2 wraps them as
+# ``{'v': 2, 'sites': [...]}``. Both store site names already unescaped.
+SITES_CACHE_VERSION = 2
+
 
-def icon_need_update(cd: CacheDirectory, s: Site) -> bool:
-    return not cd.get_site_icon_cache(s.id_).is_file()
+def get_sites_pickle(path: Path) -> Path:
+    """Get Path to the pickled copy of the sites cache at ``path``."""
+    return path.with_suffix('.pkl')
 
 
 def load_sites_from_cache(path: Path) -> ty.List[Site]:
-    with open(path, encoding='utf-8') as infile:
-        return list(itertools.starmap(Site, json.load(infile)))
+    """
+    Load sites from the pickled copy if it's usable and not older than the
+    JSON cache at ``path``, otherwise from the JSON cache.
+    """
+    logger = logging.getLogger('so.load_sites_from_cache')
+    pickle_path = get_sites_pickle(path)
+    try:
+        # The pickle is written after the JSON, so an older pickle means the
+        # JSON has been rewritten without it
+        if os.stat(pickle_path).st_mtime < os.stat(path).st_mtime:
+            raise ValueError('Pickled sites cache is stale')
+        return pickle.loads(pickle_path.read_bytes())
+    except Exception as err:
+        logger.debug('Falling back to JSON sites cache due to %s: %r',
+                     type(err).__name__, str(err))
+    data = json_loads(path.read_bytes())
+    if isinstance(data, dict):
+        if data.get('v') != SITES_CACHE_VERSION:
+            raise ValueError('Unsupported sites cache version: {!r}'.format(
+                data.get('v')))
+        data = data['sites']
+    return [
+        Site(id_, name, audience, icon_url, is_meta)
+        for id_, name, audience, icon_url, is_meta in data
+    ]
 
 
 def dump_sites_to_cache(sites: ty.List[Site], path: Path) -> None:
-    with open(path, 'w', encoding='utf-8') as outfile:
-        json.dump(sites, outfile, default=dataclasses.astuple)
+    data = {'v': SITES_CACHE_VERSION, 'sites': sites}
+    path.write_bytes(json_dumps(data, default=dataclasses.astuple))
+    # Must come after the JSON; see load_sites_from_cache
+    get_sites_pickle(path).write_bytes(
+        pickle.dumps(sites, protocol=pickle.HIGHEST_PROTOCOL))
 
 
-def load_answers_from_cache(path: Path):
-    with gzip.open(path, 'rb') as infile:
-        return list(itertools.starmap(Answer, json.load(infile)))
+def load_answers_from_cache(path: Path) -> ty.List[Answer]:
+    return pickle.loads(path.read_bytes())
 
 
 def dump_answers_to_cache(answers: ty.List[Answer], path: Path) -> None:
-    with gzip.open(path, 'wb') as outfile:
-        outfile.write(
-            json.dumps(answers, default=dataclasses.astuple).encode('utf-8'))
+    path.write_bytes(pickle.dumps(answers, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_hits_from_cache(path: Path) -> ty.Dict[str, int]:
+    """
+    Load the mapping from answers cache filename to hit count. A missing or
+    malformed file is treated as empty.
+    """
+    try:
+        hits = json_loads(path.read_bytes())
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(hits, dict) or not all(
+            isinstance(v, int) for v in hits.values()):
+        return {}
+    return hits
+
+
+def dump_hits_to_cache(hits: ty.Dict[str, int], path: Path) -> None:
+    # Write to a temporary file first so that concurrent searches never read
+    # a partially written file.
+    tmp_path = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+    tmp_path.write_bytes(json_dumps(hits))
+    os.replace(tmp_path, path)
 
 
-def older_than(path: Path, seconds: int) -> bool:
-    return time.time() - os.path.getmtime(path) >= seconds
+def effective_max_age(cache_max_age: int, hit_count: int) -> float:
+    """
+    Shorten the max age of frequently reused answers, so that they are kept
+    fresher, down to a quarter of ``cache_max_age``.
+    """
+    return cache_max_age * max(0.25, 1.0 - 0.1 * math.log1p(hit_count))
+
+
+def older_than(st: os.stat_result, seconds: float) -> bool:
+    return time.time() - st.st_mtime >= seconds
+
+
+def prune_cache_dir(directory: Path, pattern: str,
+                    max_entries: int) -> ty.List[str]:
+    """
+    Remove the least recently modified files matching ``pattern`` in
+    ``directory`` such that at most ``max_entries`` of them remain. Returns
+    the names of the removed files.
+    """
+    logger = logging.getLogger('so.prune_cache_dir')
+    entries = []
+    for path in directory.glob(pattern):
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            pass
+    if len(entries) <= max_entries:
+        return []
+    entries.sort()
+    removed = []
+    for _, path in entries[:len(entries) - max_entries]:
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+        removed.append(path.name)
+    logger.info('Removed %d files from %r', len(removed), str(directory))
+    return removed
+
+
+def prune_answers_cache(cd: CacheDirectory,
+                        max_entries: int = 500) -> ty.List[str]:
+    """Bound the number of cached answers. Returns the removed filenames."""
+    # Match any file so that entries of former cache formats go away too
+    return prune_cache_dir(cd.answers_dir, '*', max_entries)
+
+
+def prune_icons_cache(cd: CacheDirectory,
+                      max_entries: int = 2000) -> ty.List[str]:
+    """Bound the number of cached icons. Returns the removed filenames."""
+    return prune_cache_dir(cd.icons_dir, '*.png', max_entries)
+
+
+# Script filter response reporting an error, to be filled with the JSON
+# encoded title and subtitle
+ERROR_RESPONSE_TEMPLATE = (
+    '{"items":[{"title":%s,"subtitle":%s,"valid":false,'
+    '"icon":{"path":"error-icon.png"}}]}')
 
 
 def response_written(func):
     def _wrapper(*args):
         try:
-            resp = func(*args)
+            out = json_dumps(func(*args))
         except Exception as err:
-            resp = {
-                'items': [
-                    {
-                        'title': 'Error occurs: {}'.format(type(err).__name__),
-                        'subtitle': 'Message: {}'.format(str(err)),
-                        'valid': False,
-                        'icon': {
-                            'path': 'error-icon.png',
-                        },
-                    },
-                ],
-            }
-        print(json.dumps(resp), end='')
+            encode = json.encoder.encode_basestring_ascii
+            out = (ERROR_RESPONSE_TEMPLATE % (
+                encode('Error occurs: {}'.format(type(err).__name__)),
+                encode('Message: {}'.format(str(err))),
+            )).encode('utf-8')
+        sys.stdout.buffer.write(out)
+        sys.stdout.buffer.flush()
 
     return _wrapper
 
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def fetch_and_save_icon(
+    session: 'requests.Session',
+    proxies: ty.Optional[ty.Dict[str, str]],
+    s: Site,
+    cd: CacheDirectory,
+) -> bool:
+    """
+    Download the icon of a site and save it to cache. Returns ``True`` if
+    the icon has been saved.
+    """
+    logger = logging.getLogger('so.fetch_and_save_icon')
+    logger.debug('Cachine icon of site_id=%r', s.id_)
+    logger.debug('Downloading icon from %s', s.icon_url)
+    try:
+        resp = session.get(
+            s.icon_url, proxies=proxies, timeout=REQUEST_TIMEOUT)
+    except Exception as err:
+        logger.warning('Error %s with message: %r',
+                       type(err).__name__, str(err))
+        return False
+    path = cd.get_site_icon_cache(s.id_)
+    if resp.content.startswith(PNG_SIGNATURE):
+        # Already what we would save; no need to decode and re-encode it
+        logger.debug('Saving the PNG as is to %r', path)
+        path.write_bytes(resp.content)
+        return True
+
+    from PIL import Image
+
+    logger.debug('Trying to read %s as image', s.icon_url)
+    try:
+        icon = Image.open(io.BytesIO(resp.content))
+    except Exception as err:
+        logger.warning('Error %s with message: %r',
+                       type(err).__name__, str(err))
+        return False
+    logger.debug('Saving the image (width=%d, height=%d) to %r', icon.width,
+                 icon.height, path)
+    icon.save(path, 'PNG')
+    return True
+
+
 def do_cache_sites(
     cd: CacheDirectory,
     env: EnvParams,
@@ -323,30 +675,26 @@ def do_cache_sites(
     sites = request_parse_sites_api(env)
     dump_sites_to_cache(sites, cd.get_sites_cache())
     logger.info('Retrieved %d StackExchange sites', len(sites))
-    outstanding_sites = filter(functools.partial(icon_need_update, cd), sites)
+    cached_icons = cd.existing_icon_set()
+    outstanding_sites = [s for s in sites if s.id_ not in cached_icons]
+    session = get_session()
+    proxies = get_proxies(env)
+    cd.ensure_icons_dir()
     correct_counter = 0
-    for s in outstanding_sites:
-        logger.debug('Cachine icon of site_id=%r', s.id_)
-        logger.debug('Downloading icon from %s', s.icon_url)
-        try:
-            resp = requests.get(s.icon_url, {}, **build_requests_kwargs(env))
-        except Exception as err:
-            logger.warning('Error %s with message: %r',
-                           type(err).__name__, str(err))
-            continue
-        logger.debug('Trying to read %s as image', s.icon_url)
-        try:
-            icon = Image.open(io.BytesIO(resp.content))
-        except Exception as err:
-            logger.warning('Error %s with message: %r',
-                           type(err).__name__, str(err))
-            continue
-        path = cd.get_site_icon_cache(s.id_)
-        logger.debug('Saving the image (width=%d, height=%d) to %r',
-                     icon.width, icon.height, path)
-        icon.save(path)
-        correct_counter += 1
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=ICON_DOWNLOAD_WORKERS) as executor:
+        futures = [
+            executor.submit(fetch_and_save_icon, session, proxies, s, cd)
+            for s in outstanding_sites
+        ]
+        for fut in concurrent.futures.as_completed(futures):
+            try:
+                correct_counter += int(fut.result())
+            except Exception as err:
+                logger.warning('Error %s with message: %r',
+                               type(err).__name__, str(err))
     logger.info('Correctly processed %d icons', correct_counter)
+    prune_icons_cache(cd)
 
 
 @response_written
@@ -375,22 +723,34 @@ def do_sites(cd: CacheDirectory, env: EnvParams, query: str) -> dict:
         }
     if env.ignore_meta_sites:
         sites = [s for s in sites if not s.is_meta]
-    name_to_sites = {s.name: s for s in sites}
     if query:
-        filtered_names = request_fzf(query, list(name_to_sites))
-        sites = [name_to_sites[name] for name in filtered_names]
+        indices = request_fzf(query, [s.name for s in sites])
+        sites = [sites[i] for i in indices]
+    if not sites:
+        return {
+            'items': [
+                {
+                    'title': 'No matching sites',
+                    'subtitle': 'Try a different query',
+                    'valid': False,
+                },
+            ],
+        }
+    # List the icons directory once rather than stat each icon
+    cached_icons = cd.existing_icon_set()
     items = []
     for s in sites:
-        icon_path = cd.get_site_icon_cache(s.id_)
-        if not icon_path.is_file():
-            icon_path = Path('icon.png')
+        if s.id_ in cached_icons:
+            icon_path = str(cd.get_site_icon_cache(s.id_))
+        else:
+            icon_path = FALLBACK_ICON
         items.append({
             'title': s.name,
             'subtitle': s.audience,
             'arg': s.id_,
             'uid': s.id_,
             'icon': {
-                'path': str(icon_path),
+                'path': icon_path,
             },
             'text': {
                 'copy': s.id_,
@@ -409,12 +769,6 @@ def do_sites(cd: CacheDirectory, env: EnvParams, query: str) -> dict:
                 },
             },
         })
-    if not items:
-        items.append({
-            'title': 'No matching sites',
-            'subtitle': 'Try a different query',
-            'valid': False,
-        })
     return {'items': items}
 
 
@@ -430,6 +784,8 @@ def parse_search_query(string: str) -> ty.Tuple[str, ty.List[str], str]:
     else:
         rest, additional_query = string, ''
     words = rest.split()
+    if '#' not in rest:  # the common case: no tags at all
+        return ' '.join(words), [], additional_query
     query_words = []
     tags = []
     for w in words:
@@ -456,20 +812,56 @@ def do_search(
                 additional_query)
 
     answers_path = cd.get_answers_cache(env.site_id, query, tags)
-    if not answers_path.is_file() or older_than(answers_path,
-                                                env.cache_max_age):
+    try:
+        answers_stat = os.stat(answers_path)
+    except FileNotFoundError:
+        answers_stat = None
+    hits_path = cd.get_hits_cache()
+    hits = None
+    hit_count = 0
+    # The hit count only matters when there are cached answers to judge. When
+    # refining the results with '//', the same search is re-run on every
+    # keystroke; that is not a reuse, so the plain max age is used instead.
+    if answers_stat is not None and not additional_query:
+        hits = load_hits_from_cache(hits_path)
+        hit_count = hits.get(answers_path.name, 0)
+    max_age = effective_max_age(env.cache_max_age, hit_count)
+    logger.debug('Got hit_count=%d, max_age=%.1f', hit_count, max_age)
+    hits_changed = False
+    answers = None
+    if answers_stat is not None and not older_than(answers_stat, max_age):
+        logger.info('Loading answers from cache')
+        try:
+            answers = load_answers_from_cache(answers_path)
+        except Exception as err:
+            # e.g. pickled from an incompatible version of Answer
+            logger.warning('Ignored unreadable answers cache: %s: %r',
+                           type(err).__name__, str(err))
+        else:
+            quota_remaining = 9999999
+            if hits is not None:
+                hits[answers_path.name] = hit_count + 1
+                hits_changed = True
+    if answers is None:
         logger.info('Requesting search API')
         answers, qi = request_parse_search_api(query, tags, env.site_id, env)
         quota_remaining = qi.quota_remaining
+        cd.ensure_answers_dir()
         dump_answers_to_cache(answers, answers_path)
-    else:
-        logger.info('Loading answers from cache')
-        answers = load_answers_from_cache(answers_path)
-        quota_remaining = 9999999
+        # Prune once every 50 writes or so, to amortize the directory scan
+        if random.random() < 0.02:
+            removed = prune_answers_cache(cd)
+            if removed and hits is None:
+                hits = load_hits_from_cache(hits_path)
+            for name in removed:
+                if hits.pop(name, None) is not None:
+                    hits_changed = True
+    # Only write back when there's something new, to spare the syscalls
+    if hits_changed:
+        dump_hits_to_cache(hits, hits_path)
     if additional_query:
-        title_to_answers = {a.title: a for a in answers}
-        filtered_titles = request_fzf(additional_query, list(title_to_answers))
-        answers = [title_to_answers[title] for title in filtered_titles]
+        indices = request_fzf(additional_query, [a.title for a in answers])
+        answers = [answers[i] for i in indices]
 
     items = []
     if quota_remaining < 10:
@@ -482,10 +874,12 @@ def do_search(
                 'path': 'error-icon.png',
             }
         })
+    # All answers share the icon of the site being searched
+    icon_path = cd.get_site_icon_cache(env.site_id)
+    icon_path = str(icon_path) if icon_path.is_file() else FALLBACK_ICON
+    # Not modified afterwards, so one dict can be shared by all items
+    icon = {'path': icon_path}
     for a in answers:
-        icon_path = cd.get_site_icon_cache(env.site_id)
-        if not icon_path.is_file():
-            icon_path = Path('icon.png')
         title = [a.title]
         if a.is_answered:
             title.append('✅')
@@ -499,9 +893,7 @@ def do_search(
                 'copy': a.title,
                 'largetype': a.title,
             },
-            'icon': {
-                'path': str(icon_path),
-            },
+            'icon': icon,
         })
     if not answers:
         items.append({
@@ -514,14 +906,15 @@ def do_search(
 
 def do_reveal_icon(cd: CacheDirectory, env: EnvParams) -> None:
     icon_path = cd.get_site_icon_cache(env.site_id)
-    if not icon_path.is_file():
-        icon_path = 'icon.png'
-    subprocess.run(['open', '-R', str(icon_path)], check=True)
+    icon_path = str(icon_path) if icon_path.is_file() else FALLBACK_ICON
+    subprocess.run(['open', '-R', icon_path], check=True)
 
 
 def config_logging():
-    logging.basicConfig(
-        level='WARNING', format='%(levelname)s@%(name)s: %(message)s')
+    if not logging.getLogger().handlers:
+        logging.basicConfig(
+            level=logging.WARNING,
+            format='%(levelname)s@%(name)s: %(message)s')
     if os.environ.get('alfred_debug', '') == '1':
         logging.getLogger('so').setLevel(logging.DEBUG)
 
@@ -534,8 +927,8 @@ def make_parser():
 
 
 def main():
-    env = validate_env()
     config_logging()
+    env = validate_env()
     cd = CacheDirectory()
     args = make_parser().parse_args()
     if args.action == 'cache_sites':